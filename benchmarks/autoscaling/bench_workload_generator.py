@@ -111,6 +111,7 @@ def plot_workload(workload_dict, interval_sec, output_path: str = None):
     else:
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         plt.savefig(output_path)
+        plt.close()
         logging.info(f'Saved workload plot to {output_path}')
 
 
@@ -1,63 +1,295 @@
-from kubernetes import client, config
+from kubernetes import client, config, watch
+from kubernetes.client.rest import ApiException
+from urllib3.exceptions import HTTPError
+import argparse
+import asyncio
+import math
+import random
+import threading
 import time
-import sys
 
-def wait_for_pods_ready(target_deployment):
-    v1 = client.CoreV1Api()
+WATCH_TIMEOUT_SEC = 600
+# Overall time budget of a readiness check
+DEFAULT_TIMEOUT_SEC = 600
+
+
+def backoff(base=1, cap=64):
+    """Yield capped exponential backoff delays in seconds, with jitter to avoid thundering herds."""
+    delay = base
     while True:
-        pods = v1.list_pod_for_all_namespaces().items
-        all_pods_ready = True
-        for pod in pods:
-            if target_deployment in pod.metadata.name:
-                if pod.status.phase != 'Running':
-                    all_pods_ready = False
-                    print(f"Pod {pod.metadata.name} is not running (Phase: {pod.status.phase})")
-                    break
-                # All the containers in the pod should be ready.
-                container_statuses = pod.status.container_statuses or []
-                for container in container_statuses:
-                    if not container.ready:
-                        all_pods_ready = False
-                        print(f"Container {container.name} in pod {pod.metadata.name} is not ready")
-                        break
-                if not all_pods_ready:
-                    break
-        if all_pods_ready:
-            print(f"All pods of {target_deployment} deployment and their containers are ready!")
-            return
-        # time.sleep(5)
-
-
-# Not being used
-def wait_for_all_podautoscaler_ready(namespace="default"):
-    custom_api = client.CustomObjectsApi()
+        yield min(cap, delay) * (0.5 + random.random())
+        delay *= 2
+
+
+def is_retryable_status(status):
+    """410 Gone means the watch must be restarted, 429 and 5xx are transient API server errors."""
+    return status in (410, 429) or (status is not None and status >= 500)
+
+
+def is_pod_ready(pod):
+    if pod.status.phase != 'Running':
+        print(f"Pod {pod.metadata.name} is not running (Phase: {pod.status.phase})")
+        return False
+    # All the containers in the pod should be ready.
+    container_statuses = pod.status.container_statuses or []
+    for container in container_statuses:
+        if not container.ready:
+            print(f"Container {container.name} in pod {pod.metadata.name} is not ready")
+            return False
+    return True
+
+
+def get_deployment_label_selector(deployment_name, namespace="default"):
+    apps_v1 = client.AppsV1Api()
+    deployment = apps_v1.read_namespaced_deployment(name=deployment_name, namespace=namespace)
+    match_labels = deployment.spec.selector.match_labels or {}
+    return ",".join(f"{key}={value}" for key, value in match_labels.items())
+
+
+def get_pod_deployment_name(pod):
+    """Return the deployment owning pod, its ReplicaSet is named <deployment>-<pod-template-hash>."""
+    pod_template_hash = (pod.metadata.labels or {}).get("pod-template-hash")
+    for owner in pod.metadata.owner_references or []:
+        if owner.kind == "ReplicaSet" and pod_template_hash and owner.name.endswith(f"-{pod_template_hash}"):
+            return owner.name[:-len(pod_template_hash) - 1]
+    return None
+
+
+def wait_for_pods_ready(target_deployments, namespace="default", timeout_sec=DEFAULT_TIMEOUT_SEC):
+    if isinstance(target_deployments, str):
+        target_deployments = [target_deployments]
+    # Pods are matched to targets by exact owner name, a single hash lookup per event however many targets there are.
+    targets = frozenset(target_deployments)
+    target_names = ", ".join(sorted(targets))
+    deadline = time.monotonic() + timeout_sec
+    v1 = client.CoreV1Api()
+    w = watch.Watch()
+    # Reading every deployment fails fast on a misspelled name and gives the selectors to filter pods on.
+    label_selectors = {get_deployment_label_selector(name, namespace) for name in targets}
+    # Let the API server filter pods of the deployments instead of listing every pod in the cluster.
+    # Deployments rarely share a selector, if they don't, narrow to deployment-managed pods and match owners locally.
+    label_selector = label_selectors.pop() if len(label_selectors) == 1 else "pod-template-hash"
+    pod_args = dict(namespace=namespace, label_selector=label_selector)
+    # pod name -> (owning deployment, ready)
+    pod_state = {}
+
+    def all_targets_ready():
+        # Every target needs at least one pod, and all of their pods must be ready.
+        ready_targets = set()
+        for deployment_name, ready in pod_state.values():
+            if not ready:
+                return False
+            ready_targets.add(deployment_name)
+        return ready_targets == targets
+
+    resource_version = None
+    retry_delays = backoff()
     while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Pods of {target_names} deployment are not ready after {timeout_sec}s")
         try:
-            pas = custom_api.list_namespaced_custom_object(
-                group="autoscaling.aibrix.ai",
-                version="v1alpha1",
-                namespace=namespace,
-                plural="podautoscalers"
-            )
-            all_ready = True
-            for pa in pas['items']:
-                conditions = pa.get('status', {}).get('conditions', [])
-                if not any(c['type'] == 'AbleToScale' and c['status'] == 'True' for c in conditions):
-                        all_ready = False
-                        name = pa['metadata']['name']
-                        print(f"PA {name} conditions:")
-                        for c in conditions:
-                            print(f"- Type: {c['type']}, Status: {c['status']}, Reason: {c.get('reason', 'N/A')}")
-                        break
-            if all_ready:
-                print("All podautoscaler are ready")
+            if resource_version is None:
+                # Seed the local state with a single LIST, then only apply watch deltas on top of it.
+                pods = v1.list_namespaced_pod(**pod_args)
+                pod_state = {}
+                for pod in pods.items:
+                    deployment_name = get_pod_deployment_name(pod)
+                    if deployment_name in targets:
+                        pod_state[pod.metadata.name] = (deployment_name, is_pod_ready(pod))
+                resource_version = pods.metadata.resource_version
+                retry_delays = backoff()
+                if all_targets_ready():
+                    print(f"All pods of {target_names} deployment and their containers are ready!")
+                    return
+            # The server ends the watch at the deadline, so waiting never outlives timeout_sec.
+            for event in w.stream(v1.list_namespaced_pod,
+                                  resource_version=resource_version,
+                                  timeout_seconds=math.ceil(remaining),
+                                  _request_timeout=math.ceil(remaining),
+                                  **pod_args):
+                pod = event['object']
+                resource_version = pod.metadata.resource_version
+                deployment_name = get_pod_deployment_name(pod)
+                if deployment_name not in targets:
+                    continue
+                if event['type'] == 'DELETED':
+                    pod_state.pop(pod.metadata.name, None)
+                else:
+                    pod_state[pod.metadata.name] = (deployment_name, is_pod_ready(pod))
+                if all_targets_ready():
+                    w.stop()
+                    print(f"All pods of {target_names} deployment and their containers are ready!")
+                    return
+        except (ApiException, HTTPError) as e:
+            if isinstance(e, ApiException) and not is_retryable_status(e.status):
+                raise
+            # The resourceVersion is too old to resume from, the API server is overloaded or the connection broke,
+            # start over with a fresh LIST.
+            delay = min(next(retry_delays), max(0, deadline - time.monotonic()))
+            print(f"Pod watch interrupted ({e}), re-listing pods in {delay:.1f}s")
+            time.sleep(delay)
+            resource_version = None
+
+
+def is_podautoscaler_ready(pa):
+    conditions = pa.get('status', {}).get('conditions', [])
+    if any(c['type'] == 'AbleToScale' and c['status'] == 'True' for c in conditions):
+        return True
+    name = pa['metadata']['name']
+    print(f"PA {name} conditions:")
+    for c in conditions:
+        print(f"- Type: {c['type']}, Status: {c['status']}, Reason: {c.get('reason', 'N/A')}")
+    return False
+
+
+class PodAutoscalerCache:
+    """
+    Informer-style local cache of PodAutoscalers.
+
+    The cache is seeded by a single LIST and then kept up to date by a background thread
+    consuming the watch stream, so readers never hit the API server themselves.
+    """
+
+    def __init__(self, namespace="default", watch_timeout_sec=WATCH_TIMEOUT_SEC):
+        self.custom_api = client.CustomObjectsApi()
+        self.pa_args = dict(group="autoscaling.aibrix.ai",
+                            version="v1alpha1",
+                            namespace=namespace,
+                            plural="podautoscalers")
+        self.cache = {}
+        self.synced = False
+        # Set by the watch thread when it hits an error that retrying cannot fix, e.g. 403 or a missing CRD
+        self.failed = False
+        self.error = None
+        self.condition = threading.Condition()
+        self.watch_timeout_sec = watch_timeout_sec
+        self._watch = watch.Watch()
+        self._response = None
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._watch.stop()
+        # Watch.stop() only takes effect on the next event, closing the connection ends the stream right away.
+        response = self._response
+        if response is not None:
+            response.close()
+
+    def wait_for(self, predicate, timeout=None):
+        """
+        Block until predicate(pas) holds for the cached PodAutoscalers, re-checking on every watch event.
+        Returns False if it still does not hold after timeout seconds, and re-raises the error that
+        stopped the watch thread if there is one.
+        """
+        def holds():
+            return self.synced and predicate(list(self.cache.values()))
+
+        with self.condition:
+            self.condition.wait_for(lambda: self.failed or holds(), timeout)
+            if holds():
                 return True
-        except Exception as e:
-            print(f"Error checking PAs: {e}")
+            if self.failed:
+                raise self.error
+            return False
+
+    def _open_watch(self, **kwargs):
+        """Send the watch request, keeping its response so that stop() can close it."""
+        self._response = self.custom_api.list_namespaced_custom_object(**kwargs)
+        if self._stopped:  # stop() ran before the response was stored
+            self._response.close()
+        return self._response
+
+    def _run(self):
+        resource_version = None
+        retry_delays = backoff()
+        while not self._stopped:
+            try:
+                if resource_version is None:
+                    pas = self.custom_api.list_namespaced_custom_object(**self.pa_args)
+                    with self.condition:
+                        self.cache = {pa['metadata']['name']: pa for pa in pas['items']}
+                        self.synced = True
+                        self.condition.notify_all()
+                    resource_version = pas['metadata']['resourceVersion']
+                    retry_delays = backoff()
+                for event in self._watch.stream(self._open_watch,
+                                                resource_version=resource_version,
+                                                timeout_seconds=self.watch_timeout_sec,
+                                                _request_timeout=self.watch_timeout_sec,
+                                                **self.pa_args):
+                    pa = event['object']
+                    resource_version = pa['metadata']['resourceVersion']
+                    with self.condition:
+                        if event['type'] == 'DELETED':
+                            self.cache.pop(pa['metadata']['name'], None)
+                        else:
+                            self.cache[pa['metadata']['name']] = pa
+                        self.condition.notify_all()
+            except Exception as e:
+                if self._stopped:
+                    return
+                if not isinstance(e, HTTPError) and not (isinstance(e, ApiException) and is_retryable_status(e.status)):
+                    # Hand the error to the waiters instead of retrying until their timeout.
+                    with self.condition:
+                        self.error = e
+                        self.failed = True
+                        self.condition.notify_all()
+                    return
+                delay = next(retry_delays)
+                print(f"Error checking PAs: {e}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                # Re-list on 410 Gone as well as on transient errors, the local state may be stale.
+                resource_version = None
+
+
+def wait_for_all_podautoscaler_ready(namespace="default", timeout_sec=DEFAULT_TIMEOUT_SEC):
+    # A PA that became able to scale stays so for this check, don't scan its conditions again on later events.
+    ready_names = set()
+
+    def all_ready(pas):
+        for pa in pas:
+            name = pa['metadata']['name']
+            if name in ready_names:
+                continue
+            if not is_podautoscaler_ready(pa):
+                return False
+            ready_names.add(name)
+        return True
+
+    # Watch requests never outlive the caller's timeout, even if the connection could not be closed.
+    pa_cache = PodAutoscalerCache(namespace, watch_timeout_sec=math.ceil(timeout_sec)).start()
+    try:
+        if not pa_cache.wait_for(all_ready, timeout_sec):
+            raise TimeoutError(f"Podautoscalers in {namespace} namespace are not ready after {timeout_sec}s")
+    finally:
+        pa_cache.stop()
+    print("All podautoscaler are ready")
+    return True
+
+
+async def main(args):
+    # Both checks block on their own watch streams, run them side by side so the total wait is the slower of the two.
+    checks = [asyncio.to_thread(wait_for_pods_ready, args.deployments, args.namespace, args.timeout)]
+    if args.wait_for_podautoscalers:
+        checks.append(asyncio.to_thread(wait_for_all_podautoscaler_ready, args.namespace, args.timeout))
+    await asyncio.gather(*checks)
 
 
 if __name__ == "__main__":
-    target_deployment = sys.argv[1]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("deployments", nargs="+", help="Deployment names")
+    parser.add_argument("--namespace", default="default", help="Namespace of the deployments")
+    parser.add_argument("--wait-for-podautoscalers", action="store_true",
+                        help="Also wait until all podautoscalers in the namespace are able to scale")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT_SEC,
+                        help="Seconds to wait for readiness before failing")
+    args = parser.parse_args()
     config.load_kube_config(context="ccr3aths9g2gqedu8asdg@41073177-kcu0mslcp5mhjsva38rpg")
-    wait_for_pods_ready(target_deployment)
+    asyncio.run(main(args))
     print("All pods are ready")
@@ -82,9 +82,8 @@ kubectl rollout restart deploy ${target_deployment} -n default
 sleep_before_pod_check=20
 echo "Sleep for ${sleep_before_pod_check} seconds after restarting deployment"
 sleep ${sleep_before_pod_check}
-python check_k8s_is_ready.py ${target_deployment}
-python check_k8s_is_ready.py aibrix-controller-manager
-python check_k8s_is_ready.py aibrix-gateway-plugins
+python check_k8s_is_ready.py ${target_deployment} --namespace default --wait-for-podautoscalers
+python check_k8s_is_ready.py aibrix-controller-manager aibrix-gateway-plugins --namespace aibrix-system
 
 # Start pod log monitoring
 pod_log_dir="${experiment_result_dir}/pod_logs"
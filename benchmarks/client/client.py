@@ -8,7 +8,7 @@ import io
 import traceback
 
 
-from typing import List
+from typing import Iterable
 from utils import (load_workload, wrap_prompt_as_chat_message)
 
 logging.basicConfig(level=logging.INFO)
@@ -113,7 +113,7 @@ async def send_request_streaming(client: openai.AsyncOpenAI,
 async def benchmark_streaming(client: openai.AsyncOpenAI,
                               endpoint: str,  
                               model: str, 
-                              load_struct: List,
+                              load_struct: Iterable,
                               output_file: io.TextIOWrapper):
     request_id = 0
     batch_tasks = []
@@ -186,7 +186,7 @@ async def send_request_batch(client, model, endpoint, prompt, output_file):
 async def benchmark_batch(client: openai.AsyncOpenAI,
                           endpoint: str, 
                           model: str, 
-                          load_struct: List, 
+                          load_struct: Iterable, 
                           output_file: io.TextIOWrapper):
     batch_tasks = []
     base_time = time.time()
@@ -213,7 +213,9 @@ async def benchmark_batch(client: openai.AsyncOpenAI,
 def main(args):
     logging.info(f"Starting benchmark on endpoint {args.endpoint}")
     with open(args.output_file_path, 'w', encoding='utf-8') as output_file:
-        load_struct = load_workload(args.workload_path)
+        # Parse the whole workload before the benchmark clock starts, so malformed entries fail
+        # before any request is sent and parsing does not delay request dispatch.
+        load_struct = list(load_workload(args.workload_path))
         client = openai.AsyncOpenAI(
             api_key=args.api_key,
             base_url=args.endpoint + "/v1",
@@ -1,15 +1,28 @@
-import json
-from typing import List, Any
+import ijson
+import orjson
+from typing import Iterator, Any
 
-def load_workload(input_path: str) -> List[Any]:
-    load_struct = None
+def load_workload(input_path: str) -> Iterator[Any]:
+    """
+    Open the workload file and return an iterator that yields its entries one at a time, so memory
+    stays bounded by a single entry. The file is opened right away and a bad path fails here, but
+    entries are parsed lazily: a malformed entry only raises once iteration reaches it. Wrap the
+    result in list() to parse and validate the whole workload up front.
+    """
+    file = open(input_path, "rb")
     if input_path.endswith(".jsonl"):
-        with open(input_path, "r") as file:
-            load_struct = [json.loads(line) for line in file]
-    else:
-        with open(input_path, "r") as file:
-            load_struct = json.load(file)
-    return load_struct
+        return _iter_jsonl_entries(file)
+    return _iter_json_entries(file)
+
+def _iter_jsonl_entries(file) -> Iterator[Any]:
+    with file:
+        for line in file:
+            yield orjson.loads(line)
+
+def _iter_json_entries(file) -> Iterator[Any]:
+    # The top level of a .json workload is a list, parse its items incrementally.
+    with file:
+        yield from ijson.items(file, "item", use_float=True)
 
 # Function to wrap the prompt into OpenAI's chat completion message format.
 def wrap_prompt_as_chat_message(prompt: str):
@@ -7,6 +7,9 @@ import pandas as pd
 
 from typing import Tuple, Optional, List
 from transformers import PreTrainedTokenizerBase
+from utils import tokenize_lengths
+
+logger = logging.getLogger(__name__)
 
 
 def load_requests(
@@ -23,7 +26,7 @@ def load_sharegpt_requests(
         tokenizer: PreTrainedTokenizerBase,
 ) -> pd.DataFrame:
     # Load the dataset into a DataFrame
-    logging.warn(f"...Start dataframe transformation")
+    logger.info("...Start dataframe transformation")
     with open(dataset_path, encoding='utf-8') as f:
         dataset = json.load(f)
     dataset = [
@@ -32,9 +35,9 @@ def load_sharegpt_requests(
     ]
     df = pd.DataFrame(dataset, columns=["prompt", "completion"])
     # Tokenize and calculate lengths
-    df["prompt_len"] = df["prompt"].apply(lambda x: len(tokenizer(x).input_ids))
-    df["completion_len"] = df["completion"].apply(lambda x: len(tokenizer(x).input_ids))
-    logging.warn(f"...Complete dataframe transformation")
+    df["prompt_len"] = tokenize_lengths(tokenizer, df["prompt"].tolist())
+    df["completion_len"] = tokenize_lengths(tokenizer, df["completion"].tolist())
+    logger.info("...Complete dataframe transformation")
     return df
 
 def load_generated_dataset(
@@ -45,14 +48,14 @@ def load_generated_dataset(
     with open(dataset_path, encoding='utf-8') as f:
         dataset = [json.loads(line) for line in f]
     # Create a DataFrame with the desired columns
-    logging.warn(f"...Start dataframe transformation")
+    logger.info("...Start dataframe transformation")
     df = pd.DataFrame({
         'prompt': [entry['input'][0]['content'] for entry in dataset],
         'completion': [entry['output'] for entry in dataset],
         'prompt_len': [entry['prompt_tokens'] for entry in dataset],
         'completion_len': [entry['output_tokens'] for entry in dataset]
     })
-    logging.warn(f"...Complete dataframe transformation")
+    logger.info("...Complete dataframe transformation")
     return df
 
 def sample_sharegpt_requests(
@@ -136,11 +139,13 @@ def sample_requests_len_range(
                 break  # Stop relaxing for this request once a match is found
 
             # Reduce err_perc for next iteration
-            logging.debug(f"Relax err_perc {err_perc} by {err_step} new err_perc {err_perc + err_step} input_range {input_range} output_range {output_range}")
+            logger.debug("Relax err_perc %s by %s new err_perc %s input_range %s output_range %s",
+                         err_perc, err_step, err_perc + err_step, input_range, output_range)
             err_perc += err_step
 
         if err_perc >= 1:
-            logging.warn(f"No match found for request {i + 1} even after relaxing err_perc to {err_perc} fallback to random")
+            logger.warning("No match found for request %s even after relaxing err_perc to %s fallback to random",
+                           i + 1, err_perc)
             total_rows = len(df)
             sample = df.iloc[random.randint(0, total_rows - 1)] 
             filtered_results.append({"prompt": sample["prompt"],
@@ -2,15 +2,26 @@ import logging
 import json
 import os
 import csv
+import functools
+import math
 
 import numpy as np
+import orjson
 import matplotlib.pyplot as plt
 import pandas as pd
 
-from typing import List, Union, Any, Optional, Tuple, Dict
-from transformers import (AutoTokenizer, PreTrainedTokenizer,
+from typing import List, Union, Any, Optional, Tuple, Dict, Iterable, Callable
+from transformers import (AutoTokenizer, PreTrainedTokenizerBase,
                           PreTrainedTokenizerFast)
 from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# NumPy values are serialized natively by orjson, non-string dict keys are converted like the json module does.
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+# Upper bound on the number of points drawn per series by plot_workload
+MAX_PLOT_POINTS = 5000
 
 def convert_to_stat_df(qps_file: str, 
                        input_file: str, 
@@ -47,7 +58,7 @@ def convert_to_stat_df(qps_file: str,
         merged_df['timestamp'] = pd.to_datetime(merged_df['timestamp'])
     elif internal_trace_type == "cloudide":
         if input_file != output_file:
-            logging.error(f"input file {input_file} does not match output_file {output_file}")
+            logger.error("input file %s does not match output_file %s", input_file, output_file)
         df = pd.read_csv(input_file, parse_dates=['Time'])
         df = df.replace("undefined", 0)
         df['Time'] = pd.to_datetime(df['Time'], unit = 'ms')  # Ensure timestamp is a datetime object
@@ -138,33 +149,156 @@ def get_sample_interval_ms(file_path):
     interval = None
     if len(timestamps) == 2:
         interval = int((timestamps[1] - timestamps[0]).total_seconds() * 1000)
-        logging.info(f"Sampling interval: {interval} milliseconds")
+        logger.info("Sampling interval: %s milliseconds", interval)
     else:
-        logging.error("Insufficient data to calculate the sampling interval.")
+        logger.error("Insufficient data to calculate the sampling interval.")
     return interval
 
 
 def make_serializable(data):
-    """Recursively convert data into JSON serializable types."""
-    if isinstance(data, list):
-        return [make_serializable(item) for item in data]
-    elif isinstance(data, tuple):
-        return tuple(make_serializable(item) for item in data)
-    elif isinstance(data, dict):
-        return {key: make_serializable(value) for key, value in data.items()}
-    elif isinstance(data, (np.integer, np.int64)):  # Convert NumPy int types to int
-        return int(data)
-    elif isinstance(data, (np.floating, np.float64)):  # Convert NumPy float types to float
-        return float(data)
-    else:
-        return data
+    """
+    Convert data into JSON serializable types.
+
+    Nested containers are walked with an explicit stack instead of recursion, so deeply nested
+    data cannot hit the interpreter recursion limit.
+    """
+    root = [data]
+    # Each work item is (container, key, finalize_tuple), container[key] is the value still to be converted
+    stack = [(root, 0, False)]
+    while stack:
+        parent, key, finalize_tuple = stack.pop()
+        if finalize_tuple:  # All items of the tuple are converted by now
+            parent[key] = tuple(parent[key])
+            continue
+        value = parent[key]
+        if isinstance(value, dict):
+            items = dict(value)
+            keys = items.keys()
+        elif isinstance(value, (list, tuple)):
+            items = list(value)
+            keys = range(len(items))
+            if isinstance(value, tuple):
+                stack.append((parent, key, True))
+        else:
+            parent[key] = _make_leaf_serializable(value)
+            continue
+        parent[key] = items
+        for item_key in keys:
+            item = items[item_key]
+            if isinstance(item, _CONTAINER_TYPES):
+                stack.append((items, item_key, False))
+            else:
+                items[item_key] = _make_leaf_serializable(item)
+    return root[0]
+
+
+_CONTAINER_TYPES = (list, tuple, dict)
+
+
+def _make_leaf_serializable(data):
+    if isinstance(data, np.ndarray):  # Convert whole NumPy arrays to (nested) lists of Python scalars in C
+        return data.tolist()
+    elif isinstance(data, np.generic):  # Convert any NumPy scalar type to the matching Python type
+        return data.item()
+    return data
+
+
+_PLAIN_TYPES = (str, int, float, bool, type(None))
+
+
+def make_serializer(sample: Dict[str, Any]) -> Callable[[Any], Any]:
+    """
+    Return a converter for records shaped like sample, e.g. one workload entry.
+
+    Converters are cached per shape (field names and field types). Fields holding plain JSON values
+    are copied without any type dispatch and a field holding a list of records, like the requests of a
+    workload entry, is converted with the serializer of its first record's shape. Everything else is
+    handed to make_serializable, so nesting depth is never limited by recursion here.
+    """
+    return _make_record_serializer(_record_shape(sample))
+
+
+def _record_shape(record: Dict[str, Any]) -> Tuple[Tuple[Any, Any], ...]:
+    shape = []
+    for key, value in record.items():
+        if type(value) is list and value and type(value[0]) is dict:
+            # Only one level of nested records is specialized, deeper ones go through make_serializable
+            item_shape = tuple((item_key, type(item_value)) for item_key, item_value in value[0].items())
+            shape.append((key, (list, item_shape)))
+        else:
+            shape.append((key, type(value)))
+    return tuple(shape)
+
+
+@functools.lru_cache(maxsize=32)
+def _make_record_serializer(shape: Tuple[Tuple[Any, Any], ...]) -> Callable[[Any], Any]:
+    converters = {}
+    for key, value_type in shape:
+        if type(value_type) is tuple:
+            converters[key] = _make_record_list_serializer(_make_record_serializer(value_type[1]))
+        elif value_type in _PLAIN_TYPES:
+            converters[key] = _convert_plain
+        else:
+            converters[key] = make_serializable
+
+    def convert_record(record):
+        if type(record) is not dict or record.keys() != converters.keys():
+            return make_serializable(record)
+        return {key: converters[key](value) for key, value in record.items()}
+    return convert_record
+
 
+def _make_record_list_serializer(convert_record: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    def convert_record_list(data):
+        if type(data) is not list:
+            return make_serializable(data)
+        return [convert_record(record) for record in data]
+    return convert_record_list
 
+
+def _convert_plain(data):
+    return data if type(data) in _PLAIN_TYPES else make_serializable(data)
+
+
+def make_records_serializable(records: List[Any]) -> List[Any]:
+    """Convert a list of same-shaped records, such as a workload, specializing on the first record's shape."""
+    if not records or type(records[0]) is not dict:
+        return make_serializable(records)
+    convert_record = make_serializer(records[0])
+    return [convert_record(record) for record in records]
+
+
+# Tokenizers are only read after construction, so one shared instance per model can be reused across calls.
+@functools.lru_cache(maxsize=8)
 def get_tokenizer(
         pretrained_model_name_or_path: str, trust_remote_code: bool
-) -> Union[PreTrainedTokenizer, PreTrainedTokenizerFast]:
-    return AutoTokenizer.from_pretrained(pretrained_model_name_or_path,
-                                         trust_remote_code=trust_remote_code)
+) -> PreTrainedTokenizerFast:
+    # Let the Rust backend encode batches on multiple threads unless the user decided otherwise.
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")
+    tokenizer = AutoTokenizer.from_pretrained(pretrained_model_name_or_path,
+                                              trust_remote_code=trust_remote_code,
+                                              use_fast=True)
+    if not tokenizer.is_fast:
+        raise ValueError(f"No fast tokenizer available for {pretrained_model_name_or_path}, "
+                         f"got {type(tokenizer).__name__}")
+    return tokenizer
+
+
+def tokenize_lengths(tokenizer: PreTrainedTokenizerBase,
+                     texts: List[str],
+                     add_special_tokens: bool = True,
+                     batch_size: int = 1000) -> List[int]:
+    """
+    Return the token count of every text. Texts are encoded batch_size at a time, which fast tokenizers
+    parallelize across the batch, and only the lengths are kept so memory stays bounded by one batch.
+    """
+    lengths = []
+    for start in range(0, len(texts), batch_size):
+        input_ids = tokenizer(texts[start:start + batch_size],
+                              add_special_tokens=add_special_tokens,
+                              return_attention_mask=False)["input_ids"]
+        lengths.extend(len(token_ids) for token_ids in input_ids)
+    return lengths
 
 
 def plot_workload(workload_name: str, 
@@ -182,15 +316,26 @@ def plot_workload(workload_name: str,
     """
     print(f"plot_workload in directory {output_dir}")
     # Convert workload data to a DataFrame
-    data = []
-    for entry in workload:
-        timestamp_sec = entry["timestamp"] / 1000  # Convert ms to sec
-        num_requests = len(entry["requests"])
-        total_prompt_tokens = np.mean([req["prompt_length"] for req in entry["requests"]]) if entry["requests"] else 0
-        total_output_tokens = np.mean([req["output_length"] for req in entry["requests"]]) if entry["requests"] else 0
-        data.append((timestamp_sec, num_requests, total_prompt_tokens, total_output_tokens))
-
-    df = pd.DataFrame(data, columns=["timestamp", "num_requests", "total_prompt_tokens", "total_output_tokens"])
+    # Collect all fields in one pass over the entries and one pass over their requests, using structured dtypes
+    num_entries = len(workload)
+    entries = np.fromiter(((entry["timestamp"], len(entry["requests"])) for entry in workload),
+                          dtype=[("timestamp", np.float64), ("num_requests", np.int64)], count=num_entries)
+    requests = np.fromiter(((req["prompt_length"], req["output_length"])
+                            for entry in workload for req in entry["requests"]),
+                           dtype=[("prompt_length", np.float64), ("output_length", np.float64)],
+                           count=int(entries["num_requests"].sum()))
+    # Average token lengths per entry by summing each entry's requests with bincount, empty entries stay 0
+    entry_index = np.repeat(np.arange(num_entries), entries["num_requests"])
+    request_count = np.maximum(entries["num_requests"], 1)
+    total_prompt_tokens = np.bincount(entry_index, weights=requests["prompt_length"], minlength=num_entries) / request_count
+    total_output_tokens = np.bincount(entry_index, weights=requests["output_length"], minlength=num_entries) / request_count
+
+    df = pd.DataFrame({
+        "timestamp": entries["timestamp"] / 1000,  # Convert ms to sec
+        "num_requests": entries["num_requests"],
+        "total_prompt_tokens": total_prompt_tokens,
+        "total_output_tokens": total_output_tokens,
+    })
 
     # Define bins based on min/max timestamp
     min_time, max_time = df["timestamp"].min(), df["timestamp"].max()
@@ -205,6 +350,10 @@ def plot_workload(workload_name: str,
     # Convert index back to numeric
     binned_df.index = binned_df.index.astype(float)
 
+    # Long traces have far more bins than pixels, plot every n-th bin to keep rendering time and file size bounded
+    if len(binned_df) > MAX_PLOT_POINTS:
+        binned_df = binned_df.iloc[::math.ceil(len(binned_df) / MAX_PLOT_POINTS)]
+
     # Plotting
     fig, (ax_qps, ax_input, ax_output) = plt.subplots(3, 1, figsize=(15, 12))
 
@@ -225,29 +374,49 @@ def plot_workload(workload_name: str,
 
     # Save or show the plot
     if output_dir:
-        os.makedirs(os.path.dirname(output_dir), exist_ok=True)
-        plt.savefig(f"{output_dir}/{workload_name}.pdf")
-        logging.info(f'Saved workload plot to {output_dir}/{workload_name}.pdf')
+        ensure_dir(output_dir)
+        fig.savefig(f"{output_dir}/{workload_name}.pdf")
+        # Release the figure, pyplot otherwise keeps every figure alive when plotting many workloads
+        plt.close(fig)
+        logger.info("Saved workload plot to %s/%s.pdf", output_dir, workload_name)
     else:
         plt.show()
 
 
-def save_workload(load_struct: List[Any],
+_created_dirs = set()
+
+
+def ensure_dir(dir_path: Union[str, Path]):
+    """Create dir_path once per process, skipping the mkdir syscalls for directories already created."""
+    dir_path = Path(dir_path)  # An empty path becomes Path("."), which always exists
+    if dir_path not in _created_dirs:
+        dir_path.mkdir(parents=True, exist_ok=True)
+        _created_dirs.add(dir_path)
+
+
+def save_workload(load_struct: Iterable[Any],
                   output_path: str,
                   use_jsonl: Optional[bool] = False):
+    # The extension is appended rather than swapped in with with_suffix, so dots in the file name are kept
+    output_path = Path(output_path)
+    output_path = output_path.with_name(output_path.name + (".jsonl" if use_jsonl else ".json"))
     # create the path if it doesn't exist
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    ensure_dir(output_path.parent)
 
-    if use_jsonl:
-        with open(output_path + ".jsonl", "w") as file:
+    # Entries are written one at a time so load_struct can be any iterable, including a generator.
+    with output_path.open("wb") as file:
+        if use_jsonl:
             for row in load_struct:
-                json_line = json.dumps(row)  # Convert list to JSON string
-                file.write(json_line + "\n")
-            logging.warn(f'Saved workload file to {output_path + ".jsonl"}')
-    else:
-        with open(output_path + ".json", 'w') as file:
-            json.dump(load_struct, file, indent=4)
-        logging.warn(f'Saved workload file to {output_path + ".json"}')
+                file.write(orjson.dumps(row, option=ORJSON_OPTIONS) + b"\n")
+        else:
+            # Same layout as orjson.dumps(list(load_struct), option=orjson.OPT_INDENT_2)
+            separator = b"[\n"
+            for row in load_struct:
+                json_row = orjson.dumps(row, option=ORJSON_OPTIONS | orjson.OPT_INDENT_2)
+                file.write(separator + b"  " + json_row.replace(b"\n", b"\n  "))
+                separator = b",\n"
+            file.write(b"[]" if separator == b"[\n" else b"\n]")
+    logger.info("Saved workload file to %s", output_path)
 
 def load_config(config_path: str) -> Dict[str, Any]:
     with open(config_path, "r") as file:
@@ -23,7 +23,7 @@ from utils import (convert_to_stat_df,
                    read_distribution_stats,
                    get_tokenizer, 
                    plot_workload, 
-                   make_serializable, 
+                   make_records_serializable, 
                    load_config,
                    save_workload, 
                    )
@@ -82,7 +82,7 @@ def generate_from_internal_csv(prompt_file_path: str,
         output_scale = output_scale,
     )
     
-    workload = make_serializable(workload)
+    workload = make_records_serializable(workload)
     save_workload(workload, output_file, use_jsonl=to_jsonl)
     return workload
     
@@ -162,7 +162,7 @@ def generate_constant(prompt_file_path: str,
     #     idx += qps
     #     ts += interval_ms
    
-    workload = make_serializable(workload)
+    workload = make_records_serializable(workload)
     save_workload(workload, output_file, use_jsonl=to_jsonl)
     return workload
 
@@ -260,7 +260,7 @@ def generate_synthetic(prompt_file_path: str,
         ts += interval_ms
         t += 1
    
-    workload = make_serializable(workload)
+    workload = make_records_serializable(workload)
     save_workload(workload, output_file, use_jsonl=to_jsonl)
     return workload
 
@@ -325,7 +325,7 @@ def generate_from_azure_csv(file_path: str,
         current_time += time_range
 
     # Save to file
-    grouped_requests = make_serializable(grouped_requests)
+    grouped_requests = make_records_serializable(grouped_requests)
     save_workload(grouped_requests, output_file, use_jsonl=to_jsonl)
 
     return grouped_requests